@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 
 import sys
+import io
 import subprocess
 import re
 import os
+import signal
 from dataclasses import dataclass
 from typing import List, Optional, Dict, Tuple
 from pathlib import Path
@@ -15,6 +17,26 @@ from enum import Enum
 # Initialize colorama
 init(autoreset=True)
 
+# Matches a conflict marker following a newline. The literal '\n' prefix
+# lets the regex engine skip ahead quickly; a marker on the very first line
+# is checked separately against _MARKER_PREFIXES
+_MARKER_RE = re.compile(r'\n(?:<{7}|={7}|>{7})')
+_MARKER_PREFIXES = ('<<<<<<<', '=======', '>>>>>>>')
+
+# Maximum number of buffered lines before display output is written
+OUTPUT_FLUSH_LINES = 5000
+
+# Conflict markers keyed by their first character, so a single dict lookup
+# rules out most lines before any string comparison
+_MARKERS = {
+    '<': ('<<<<<<<', 'conflict_start'),
+    '=': ('=======', 'divider'),
+    '>': ('>>>>>>>', 'conflict_end'),
+}
+
+# Separator between line numbers and content in the file view
+_BAR = '│ '
+
 class ViewMode(Enum):
     HUNK = "hunk"
     FILE = "file"
@@ -25,9 +47,8 @@ class ConflictHunk:
     header: str
     ours: List[str]
     theirs: List[str]
-    context_before: List[str]  # Added context lines
-    context_after: List[str]   # Added context lines
-    start_line: Optional[int] = None
+    start_line: Optional[int] = None  # Index of the '<<<<<<<' line
+    end_line: Optional[int] = None    # Index just past the '>>>>>>>' line
 
 class GitConflictResolver:
     """Handles Git conflict resolution operations."""
@@ -38,6 +59,10 @@ class GitConflictResolver:
         self.context_lines = 3  # Number of context lines to show
         try:
             self.repo = Repo(Path.cwd())
+            # Repo.index re-reads the index file on each access, so keep one
+            # instance and write it back once via write_index()
+            self.index = self.repo.index
+            self.index_dirty = False  # Whether files were staged but not written
         except Exception as e:
             print(Fore.RED + f"Error initializing Git repository: {e}")
             sys.exit(1)
@@ -45,20 +70,35 @@ class GitConflictResolver:
     def get_conflicted_files(self) -> List[str]:
         """Retrieve a list of conflicted files in the repository."""
         try:
-            conflicted = [item.a_path for item in self.repo.index.unmerged_blobs().values()]
-            return list(set(conflicted))
+            # Keys are unique paths, in index order
+            return list(self.index.unmerged_blobs())
         except GitCommandError as e:
             print(Fore.RED + f"Error getting conflicted files: {e}")
             return []
 
-    def get_file_content(self, file_path: str) -> List[str]:
-        """Get file content with line numbers."""
+    def get_file_bytes(self, file_path: str) -> bytes:
+        """Get raw file content."""
         try:
-            with open(file_path, 'r') as f:
-                return f.readlines()
+            with open(file_path, 'rb') as f:
+                return f.read()
         except IOError as e:
             print(Fore.RED + f"Error reading file {file_path}: {e}")
-            return []
+            return b''
+
+    @staticmethod
+    def decode_text(data: bytes) -> str:
+        """Decode raw file content, translating \\r\\n and \\r to \\n."""
+        return io.StringIO(data.decode('utf-8', errors='replace'), newline=None).read()
+
+    @staticmethod
+    def split_lines(text: str) -> List[str]:
+        """Split decoded text into lines."""
+        # One C-level split that, unlike str.splitlines(), only breaks on \n
+        return io.StringIO(text, newline='\n').readlines()
+
+    def get_file_content(self, file_path: str) -> List[str]:
+        """Get file content with line numbers."""
+        return self.split_lines(self.decode_text(self.get_file_bytes(file_path)))
 
     def extract_context(self, content: List[str], start: int, end: int) -> Tuple[List[str], List[str]]:
         """Extract context lines before and after a hunk."""
@@ -66,105 +106,152 @@ class GitConflictResolver:
         after = content[end:min(len(content), end + self.context_lines)]
         return before, after
 
-    def get_conflicts(self, file_path: str) -> List[ConflictHunk]:
-        """Extract conflict hunks with context for a given file."""
-        content = self.get_file_content(file_path)
+    @staticmethod
+    def marker_offsets(text: str):
+        """Yield the offset of every line that starts with a conflict marker."""
+        if text[:7] in _MARKER_PREFIXES:
+            yield 0
+        for m in _MARKER_RE.finditer(text):
+            yield m.start() + 1
+
+    def get_conflicts(self, file_path: str) -> Tuple[str, List[ConflictHunk]]:
+        """Extract conflict hunks for a given file, along with its text."""
+        data = self.get_file_bytes(file_path)
+        # Substring search is far cheaper than decoding and splitting
+        if b'<<<<<<<' not in data:
+            return '', []
+        text = self.decode_text(data)
         hunks = []
         current_hunk = None
         state = None
-        hunk_start = None
-
-        for i, line in enumerate(content):
-            if line.startswith('<<<<<<<'):
-                if current_hunk:
-                    # Add context to previous hunk
-                    before, after = self.extract_context(content, hunk_start, i)
-                    current_hunk.context_before = before
-                    current_hunk.context_after = after
-                    hunks.append(current_hunk)
-
-                hunk_start = i
-                current_hunk = ConflictHunk(header=line, ours=[], theirs=[], 
-                                          context_before=[], context_after=[],
-                                          start_line=i)
+        body_start = None
+        line_no = 0
+        last_pos = 0
+
+        for pos in self.marker_offsets(text):
+            line_no += text.count('\n', last_pos, pos)
+            last_pos = pos
+            marker = text[pos]
+            line_end = text.find('\n', pos) + 1 or len(text)
+            if marker == '<':
+                # A hunk still open here has no '>>>>>>>' and is discarded
+                body_start = line_end
+                current_hunk = ConflictHunk(header=text[pos:line_end], ours=[], theirs=[],
+                                            start_line=line_no)
                 state = 'ours'
-            elif line.startswith('=======') and state == 'ours':
+            elif marker == '=' and state == 'ours':
+                current_hunk.ours = self.split_lines(text[body_start:pos])
+                body_start = line_end
                 state = 'theirs'
-            elif line.startswith('>>>>>>>') and state == 'theirs':
-                if current_hunk:
-                    current_hunk.theirs.append(line)
-                    # Add context for the last hunk
-                    before, after = self.extract_context(content, hunk_start, i + 1)
-                    current_hunk.context_before = before
-                    current_hunk.context_after = after
-                    hunks.append(current_hunk)
+            elif marker == '>' and state == 'theirs':
+                current_hunk.theirs = self.split_lines(text[body_start:line_end])
+                current_hunk.end_line = line_no + 1
+                hunks.append(current_hunk)
                 current_hunk = None
                 state = None
-            elif current_hunk and state:
-                if state == 'ours':
-                    current_hunk.ours.append(line)
-                else:
-                    current_hunk.theirs.append(line)
 
-        return hunks
+        return text, hunks
+
+    @staticmethod
+    def run_interactive(args: List[str]):
+        """Run a program that takes over the terminal and wait for it to exit."""
+        if not hasattr(os, 'posix_spawnp'):
+            subprocess.run(args)
+            return
+        pid = os.posix_spawnp(args[0], args, os.environ)
+        try:
+            os.waitpid(pid, 0)
+        except BaseException:
+            # Like subprocess.run, don't leave the child holding the terminal
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+            raise
+
+    def write_index(self):
+        """Write files staged during this session to the Git index."""
+        # Don't overwrite index changes made elsewhere when nothing was staged
+        if not self.index_dirty:
+            return
+        try:
+            self.index.write()
+            self.index_dirty = False
+        except (OSError, GitCommandError) as e:
+            # IndexFile.write() raises OSError when .git/index.lock is held
+            print(Fore.RED + f"Error writing index, files staged in this session were not saved: {e}")
 
     def launch_vimdiff(self, file_path: str):
         """Launch vimdiff for the conflicted file."""
         try:
-            subprocess.run(['vimdiff', 
-                          f'{file_path}.LOCAL',
-                          f'{file_path}.BASE', 
-                          f'{file_path}.REMOTE'])
+            self.run_interactive(['vimdiff',
+                                  f'{file_path}.LOCAL',
+                                  f'{file_path}.BASE',
+                                  f'{file_path}.REMOTE'])
             return True
-        except subprocess.SubprocessError as e:
+        except (OSError, subprocess.SubprocessError) as e:
             print(Fore.RED + f"Error launching vimdiff: {e}")
             return False
 
-    def display_file_view(self, file_path: str, hunks: List[ConflictHunk]):
+    def display_file_view(self, file_path: str, hunks: List[ConflictHunk],
+                          content: Optional[List[str]] = None):
         """Display the entire file with conflicts highlighted."""
-        content = self.get_file_content(file_path)
+        if content is None:
+            content = self.get_file_content(file_path)
         in_conflict = False
-        
-        print(f"\n{Fore.BLUE}File: {file_path}")
-        print(f"{Fore.BLUE}{'='*80}")
-        
+        out = [f"\n{Fore.BLUE}File: {file_path}\n", f"{Fore.BLUE}{'='*80}\n"]
+        # Local bindings avoid repeated global/attribute lookups in the loop
+        extend = out.extend
+        markers = _MARKERS
+        red, yellow, green, reset, bar = Fore.RED, Fore.YELLOW, Fore.GREEN, Style.RESET_ALL, _BAR
+
         for i, line in enumerate(content, 1):
-            if line.startswith('<<<<<<<'):
+            num = format(i, '4d')
+            mark = markers.get(line[:1])
+            kind = mark[1] if mark is not None and line.startswith(mark[0]) else None
+            if kind == 'conflict_start':
                 in_conflict = True
-                print(f"{Fore.RED}{i:4d}│ {line}", end='')
-            elif line.startswith('=======') and in_conflict:
-                print(f"{Fore.YELLOW}{i:4d}│ {line}", end='')
-            elif line.startswith('>>>>>>>') and in_conflict:
+                extend((red, num, bar, line))
+            elif kind == 'divider' and in_conflict:
+                extend((yellow, num, bar, line))
+            elif kind == 'conflict_end' and in_conflict:
                 in_conflict = False
-                print(f"{Fore.GREEN}{i:4d}│ {line}", end='')
+                extend((green, num, bar, line))
             elif in_conflict:
-                color = Fore.RED if in_conflict else Fore.GREEN
-                print(f"{color}{i:4d}│ {line}", end='')
+                extend((red, num, bar, line))
             else:
-                print(f"{Style.RESET_ALL}{i:4d}│ {line}", end='')
+                extend((reset, num, bar, line))
+
+            # Flush periodically so huge files don't build one giant string
+            if i % OUTPUT_FLUSH_LINES == 0:
+                sys.stdout.write(''.join(out))
+                out.clear()
+
+        sys.stdout.write(''.join(out))
 
-    def display_hunk(self, hunk: ConflictHunk, hunk_index: int):
+    def display_hunk(self, hunk: ConflictHunk, hunk_index: int, content: List[str]):
         """Display a single hunk with context."""
-        print(f"\n{Fore.BLUE}Conflict {hunk_index + 1}:")
-        print(f"{Fore.BLUE}{'='*80}")
-        
+        # Context is sliced here so changes to context_lines apply without re-parsing
+        context_before, context_after = self.extract_context(content, hunk.start_line, hunk.end_line)
+        out = [f"\n{Fore.BLUE}Conflict {hunk_index + 1}:\n", f"{Fore.BLUE}{'='*80}\n"]
+
         # Display context before
-        for line in hunk.context_before:
-            print(Style.RESET_ALL + line.rstrip())
-        
+        for line in context_before:
+            out.append(Style.RESET_ALL + line.rstrip() + '\n')
+
         # Display conflict
-        print(Fore.RED + hunk.header)
-        print(Fore.RED + '<<<<<<< ours')
+        out.append(Fore.RED + hunk.header + '\n')
+        out.append(Fore.RED + '<<<<<<< ours\n')
         for line in hunk.ours:
-            print(Fore.RED + line.rstrip())
-        print(Fore.YELLOW + '=======')
+            out.append(Fore.RED + line.rstrip() + '\n')
+        out.append(Fore.YELLOW + '=======\n')
         for line in hunk.theirs:
-            print(Fore.GREEN + line.rstrip())
-        print(Fore.GREEN + '>>>>>>> theirs')
-        
+            out.append(Fore.GREEN + line.rstrip() + '\n')
+        out.append(Fore.GREEN + '>>>>>>> theirs\n')
+
         # Display context after
-        for line in hunk.context_after:
-            print(Style.RESET_ALL + line.rstrip())
+        for line in context_after:
+            out.append(Style.RESET_ALL + line.rstrip() + '\n')
+
+        sys.stdout.write(''.join(out))
 
     def prompt_user(self) -> str:
         """Prompt the user for action with expanded options."""
@@ -191,18 +278,19 @@ class GitConflictResolver:
 
     def process_file(self, file_path: str):
         """Process conflicts in a file with support for different view modes."""
-        hunks = self.get_conflicts(file_path)
+        text, hunks = self.get_conflicts(file_path)
         
         if not hunks:
             print(Fore.YELLOW + "No conflict hunks found in this file.")
             return
+        content = self.split_lines(text)
 
         while True:
             if self.view_mode == ViewMode.FILE:
-                self.display_file_view(file_path, hunks)
+                self.display_file_view(file_path, hunks, content)
             else:
                 for idx, hunk in enumerate(hunks):
-                    self.display_hunk(hunk, idx)
+                    self.display_hunk(hunk, idx, content)
 
             choice = self.prompt_user()
             
@@ -218,13 +306,21 @@ class GitConflictResolver:
             elif choice == 'v':
                 self.launch_vimdiff(file_path)
             elif choice == 'e':
-                subprocess.run([self.editor, file_path])
                 try:
-                    self.repo.index.add([file_path])
+                    self.run_interactive([self.editor, file_path])
+                except OSError as e:
+                    print(Fore.RED + f"Error launching editor {self.editor}: {e}")
+                    continue
+                try:
+                    self.index.add([file_path], write=False)
+                    self.index_dirty = True
                     print(Fore.CYAN + "Manually edited and staged the file.")
                     break
                 except GitCommandError as e:
                     print(Fore.RED + f"Error staging file: {e}")
+                # The editor may have changed the file; refresh the cached copy
+                text, hunks = self.get_conflicts(file_path)
+                content = self.split_lines(text)
             else:
                 # Handle regular conflict resolution
                 self.resolve_hunk(file_path, hunks[0], 0)  # Start with first hunk
@@ -240,7 +336,10 @@ def main():
         
         if all([local, base, remote, merged]):
             resolver = GitConflictResolver()
-            resolver.process_file(merged)
+            try:
+                resolver.process_file(merged)
+            finally:
+                resolver.write_index()
             sys.exit(0)
 
     # Regular operation
@@ -251,8 +350,12 @@ def main():
         print(Fore.GREEN + "No conflicted files found. Exiting.")
         sys.exit(0)
 
-    for file_path in conflicted_files:
-        resolver.process_file(file_path)
+    # Write staged files however the loop exits (quit, Ctrl-C, errors)
+    try:
+        for file_path in conflicted_files:
+            resolver.process_file(file_path)
+    finally:
+        resolver.write_index()
 
     print(Fore.GREEN + "\nAll conflicts processed.")
 